@@ -5,33 +5,117 @@ Provides tools to run dockerized tests in OpenWRT environment
 """
 
 import asyncio
-import json
+import contextlib
 import os
-import subprocess
+import re
+import shlex
+import shutil
 import sys
+import time
 from pathlib import Path
-from typing import Any, Dict, List, Optional
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
 from mcp.server import Server
-from mcp.server.models import InitializationOptions
 from mcp.server.stdio import stdio_server
-from mcp.types import (
-    CallToolRequest,
-    CallToolResult,
-    ListToolsRequest,
-    ListToolsResult,
-    Resource,
-    TextContent,
-    Tool,
-)
+from mcp.types import CallToolResult, TextContent, Tool
+
+# uvloop is optional; it speeds up the subprocess and pipe I/O we do
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
 
 # MCP Server instance
 server = Server("uci-config-test-server")
 
 # Repository root directory
 REPO_ROOT = Path(__file__).parent
-TEST_SCRIPT = REPO_ROOT / "test" / "run-tests.sh"
+TEST_DIR = REPO_ROOT / "test"
 DOCKER_COMPOSE_FILE = REPO_ROOT / "docker-compose.yml"
+DOCKERFILE = REPO_ROOT / "Dockerfile"
+
+# Compose service running the tests and the image it builds. Without an
+# explicit `image:` key Compose tags it <project>-<service>, where the
+# project name defaults to the normalized compose file directory name.
+TEST_SERVICE = "lua-test"
+COMPOSE_PROJECT = re.sub(
+    r"[^a-z0-9_-]", "",
+    os.environ.get("COMPOSE_PROJECT_NAME", DOCKER_COMPOSE_FILE.parent.name).lower()
+)
+TEST_IMAGE = f"{COMPOSE_PROJECT}-{TEST_SERVICE}"
+
+def read_base_images(dockerfile: Path) -> List[str]:
+    """Return the registry images named in a Dockerfile's FROM lines."""
+    try:
+        lines = dockerfile.read_text().splitlines()
+    except OSError:
+        return []
+    
+    images: List[str] = []
+    stages = set()
+    for line in lines:
+        parts = [part for part in line.split() if not part.startswith("--")]
+        if len(parts) < 2 or parts[0].upper() != "FROM":
+            continue
+        image = parts[1]
+        # Skip earlier build stages, scratch and build-arg substitutions
+        if image not in stages and image != "scratch" and "$" not in image and image not in images:
+            images.append(image)
+        if len(parts) >= 4 and parts[2].upper() == "AS":
+            stages.add(parts[3])
+    return images
+
+# Base images pulled ahead of a forced rebuild
+BASE_IMAGES = read_base_images(DOCKERFILE)
+
+def env_int(name: str, default: int, minimum: int = 1) -> int:
+    """Read a positive integer setting from the environment.
+
+    Bad values are reported on stderr (stdout carries the MCP protocol)
+    and replaced by the default, or clamped up to minimum.
+    """
+    raw = os.environ.get(name)
+    if raw is None:
+        return default
+    try:
+        value = int(raw)
+    except ValueError:
+        print(f"{name}={raw!r} is not an integer; using {default}", file=sys.stderr)
+        return default
+    if value < minimum:
+        print(f"{name}={value} is below {minimum}; using {minimum}", file=sys.stderr)
+        return minimum
+    return value
+
+# Pipe read size used when streaming subprocess output
+READ_CHUNK_SIZE = 64 * 1024
+
+# Per-stream output cap; a command exceeding it is stopped and truncated
+MAX_OUTPUT_BYTES = env_int("MCP_MAX_OUTPUT_BYTES", 8 * 1024 * 1024)
+
+# Default wall-clock limit for a test run, in seconds
+DEFAULT_TIMEOUT = 600
+
+# How long a stopped command gets to clean up before it is killed; this
+# is what lets `docker compose run --rm` stop and remove its container
+STOP_GRACE_PERIOD = 10
+
+# Successful Docker version probes are reused for a short while so
+# back-to-back status calls don't respawn the docker CLI every time
+DOCKER_PROBE_TTL = 30.0
+_docker_probe_cache: Optional[Tuple[float, Dict[str, Any]]] = None
+_docker_probe_lock = asyncio.Lock()
+
+# Bounds on concurrent `docker compose run`/`build` processes; builds
+# serialize on the daemon anyway, so by default only one runs at a time
+_docker_semaphore = asyncio.Semaphore(env_int("MCP_MAX_DOCKER", 4))
+_docker_build_semaphore = asyncio.Semaphore(env_int("MCP_MAX_DOCKER_BUILDS", 1))
+
+# Absolute paths of executables found on PATH
+_executable_cache: Dict[str, str] = {}
+
+# Test file listing, keyed on the test directory's mtime
+_test_file_cache: Optional[Tuple[int, List[str]]] = None
 
 @server.list_tools()
 async def list_tools() -> List[Tool]:
@@ -53,10 +137,21 @@ async def list_tools() -> List[Tool]:
                         "description": "Run a specific test file (e.g., 'test_uci_config.lua')",
                         "default": None
                     },
+                    "specific_tests": {
+                        "type": "array",
+                        "items": {"type": "string"},
+                        "description": "Run several test files in order inside one container",
+                        "default": None
+                    },
                     "rebuild": {
                         "type": "boolean", 
                         "description": "Force rebuild of Docker image",
                         "default": False
+                    },
+                    "timeout": {
+                        "type": "number",
+                        "description": "Abort the test run after this many seconds",
+                        "default": DEFAULT_TIMEOUT
                     }
                 }
             }
@@ -75,6 +170,11 @@ async def list_tools() -> List[Tool]:
                         "type": "boolean",
                         "description": "Enable verbose output",
                         "default": False
+                    },
+                    "timeout": {
+                        "type": "number",
+                        "description": "Abort the test run after this many seconds",
+                        "default": DEFAULT_TIMEOUT
                     }
                 },
                 "required": ["test_file"]
@@ -130,299 +230,482 @@ async def call_tool(name: str, arguments: Dict[str, Any]) -> CallToolResult:
         raise ValueError(f"Unknown tool: {name}")
 
 async def run_tests(arguments: Dict[str, Any]) -> CallToolResult:
-    """Run all tests or a specific test."""
+    """Run all tests, a specific test, or a batch of specific tests."""
     try:
         verbose = arguments.get("verbose", False)
         specific_test = arguments.get("specific_test")
+        specific_tests = arguments.get("specific_tests") or []
         rebuild = arguments.get("rebuild", False)
+        timeout = get_timeout(arguments)
         
-        # Change to repository root
-        os.chdir(REPO_ROOT)
+        # Validate a requested batch before touching Docker
+        if specific_tests:
+            available = set(get_test_files())
+            missing = [test_file for test_file in specific_tests if test_file not in available]
+            if missing:
+                return _text_result(f"Test file not found: {', '.join(missing)}")
         
         # Check if Docker is available
         docker_check = await check_docker_availability()
         if not docker_check["available"]:
-            return CallToolResult(
-                content=[TextContent(
-                    type="text",
-                    text=f"Docker not available: {docker_check['error']}"
-                )]
-            )
+            return _text_result(f"Docker not available: {docker_check['error']}")
         
         # Build image if needed or requested
         if rebuild:
             build_result = await build_image(force=rebuild)
             if not build_result["success"]:
-                return CallToolResult(
-                    content=[TextContent(
-                        type="text", 
-                        text=f"Failed to build Docker image: {build_result['error']}"
-                    )]
-                )
+                return _text_result(f"Failed to build Docker image: {build_result['error']}")
         
         # Prepare command
-        if specific_test:
-            # Run specific test
-            cmd = [
-                "docker", "compose", "run", "--rm", "lua-test",
-                "sh", "-c", f"echo '=== Running {specific_test} ===' && lua test/{specific_test}"
-            ]
+        # A batch runs in a single container rather than one per test
+        if specific_tests:
+            test_files = specific_tests
+        elif specific_test:
+            test_files = [specific_test]
         else:
-            # Run all tests using the test script
-            cmd = ["./test/run-tests.sh"]
+            test_files = get_test_files()
+        if not test_files:
+            return _text_result("No test files found in test/ directory")
+        cmd = build_test_command(test_files)
         
         # Execute tests
-        result = await run_command(cmd, verbose=verbose)
-        
-        # Parse results
-        output = result["stdout"] + result["stderr"]
-        success = result["returncode"] == 0
-        
-        # Format output
-        status = "✅ PASSED" if success else "❌ FAILED"
-        formatted_output = f"""
-{status} - UCI Config Tool Tests
-
-Return Code: {result['returncode']}
-
-=== TEST OUTPUT ===
-{output}
-
-=== SUMMARY ===
-Tests {'completed successfully' if success else 'failed'}
-        """.strip()
-        
-        return CallToolResult(
-            content=[TextContent(
-                type="text",
-                text=formatted_output
-            )]
-        )
+        result = await run_command(cmd, verbose=verbose, timeout=timeout)
+        return _text_result(format_test_output(result))
         
     except Exception as e:
-        return CallToolResult(
-            content=[TextContent(
-                type="text",
-                text=f"Error running tests: {str(e)}"
-            )]
-        )
+        return _text_result(f"Error running tests: {str(e)}")
 
 async def run_single_test(arguments: Dict[str, Any]) -> CallToolResult:
     """Run a single test file."""
     try:
         test_file = arguments["test_file"]
         verbose = arguments.get("verbose", False)
+        timeout = get_timeout(arguments)
         
         # Validate test file exists
-        test_path = REPO_ROOT / "test" / test_file
-        if not test_path.exists():
-            return CallToolResult(
-                content=[TextContent(
-                    type="text",
-                    text=f"Test file not found: {test_file}"
-                )]
-            )
+        if test_file not in get_test_files():
+            return _text_result(f"Test file not found: {test_file}")
+        
+        # Check if Docker is available
+        docker_check = await check_docker_availability()
+        if not docker_check["available"]:
+            return _text_result(f"Docker not available: {docker_check['error']}")
         
         # Run the specific test
-        return await run_tests({
-            "verbose": verbose,
-            "specific_test": test_file,
-            "rebuild": False
-        })
+        cmd = build_test_command([test_file])
+        result = await run_command(cmd, verbose=verbose, timeout=timeout)
+        return _text_result(format_test_output(result))
         
     except Exception as e:
-        return CallToolResult(
-            content=[TextContent(
-                type="text",
-                text=f"Error running single test: {str(e)}"
-            )]
-        )
+        return _text_result(f"Error running single test: {str(e)}")
 
 async def build_test_image(arguments: Dict[str, Any]) -> CallToolResult:
     """Build the Docker test image."""
     try:
         force = arguments.get("force", False)
         
-        os.chdir(REPO_ROOT)
-        
         # Check Docker availability
         docker_check = await check_docker_availability()
         if not docker_check["available"]:
-            return CallToolResult(
-                content=[TextContent(
-                    type="text",
-                    text=f"Docker not available: {docker_check['error']}"
-                )]
-            )
-        
-        # Build command
-        cmd = ["docker", "compose", "build"]
-        if force:
-            cmd.append("--no-cache")
+            return _text_result(f"Docker not available: {docker_check['error']}")
         
-        result = await run_command(cmd, verbose=True)
+        result = await build_image(force=force, verbose=True)
         
-        if result["returncode"] == 0:
+        if result["skipped"]:
+            status = f"✅ Image {TEST_IMAGE} already built (use force to rebuild)"
+        elif result["success"]:
             status = "✅ Build successful"
         else:
             status = "❌ Build failed"
         
-        output = f"""
-{status}
-
-=== BUILD OUTPUT ===
-{result['stdout']}
-{result['stderr']}
-        """.strip()
+        output = "\n".join([
+            status,
+            "",
+            "=== BUILD OUTPUT ===",
+            result["output"]
+        ])
         
-        return CallToolResult(
-            content=[TextContent(
-                type="text",
-                text=output
-            )]
-        )
+        return _text_result(output)
         
     except Exception as e:
-        return CallToolResult(
-            content=[TextContent(
-                type="text",
-                text=f"Error building image: {str(e)}"
-            )]
-        )
+        return _text_result(f"Error building image: {str(e)}")
 
 async def list_test_files(arguments: Dict[str, Any]) -> CallToolResult:
     """List available test files."""
     try:
-        test_dir = REPO_ROOT / "test"
-        test_files = []
-        
-        if test_dir.exists():
-            for file in test_dir.glob("test_*.lua"):
-                test_files.append(file.name)
+        test_files = get_test_files()
         
         if test_files:
-            file_list = "\n".join(f"  - {file}" for file in sorted(test_files))
+            file_list = "\n".join(f"  - {file}" for file in test_files)
             output = f"Available test files:\n{file_list}"
         else:
             output = "No test files found in test/ directory"
         
-        return CallToolResult(
-            content=[TextContent(
-                type="text",
-                text=output
-            )]
-        )
+        return _text_result(output)
         
     except Exception as e:
-        return CallToolResult(
-            content=[TextContent(
-                type="text",
-                text=f"Error listing test files: {str(e)}"
-            )]
-        )
+        return _text_result(f"Error listing test files: {str(e)}")
 
 async def check_docker_status(arguments: Dict[str, Any]) -> CallToolResult:
     """Check Docker and Docker Compose status."""
     try:
         docker_check = await check_docker_availability()
+        if docker_check["available"]:
+            docker_check = await get_docker_versions()
         
         if docker_check["available"]:
-            # Get Docker info
-            docker_result = await run_command(["docker", "--version"])
-            compose_result = await run_command(["docker", "compose", "version"])
-            
-            output = f"""
-✅ Docker Environment Ready
-
-Docker: {docker_result['stdout'].strip()}
-Docker Compose: {compose_result['stdout'].strip()}
-
-Repository: {REPO_ROOT}
-Test Script: {TEST_SCRIPT}
-Docker Compose File: {DOCKER_COMPOSE_FILE}
-            """.strip()
+            output = "\n".join([
+                "✅ Docker Environment Ready",
+                "",
+                f"Docker: {docker_check['docker']}",
+                f"Docker Compose: {docker_check['compose']}",
+                "",
+                f"Repository: {REPO_ROOT}",
+                f"Test Service: {TEST_SERVICE}",
+                f"Docker Compose File: {DOCKER_COMPOSE_FILE}"
+            ])
         else:
-            output = f"""
-❌ Docker Environment Not Available
-
-Error: {docker_check['error']}
-
-Please ensure Docker and Docker Compose are installed and running.
-            """.strip()
+            output = "\n".join([
+                "❌ Docker Environment Not Available",
+                "",
+                f"Error: {docker_check['error']}",
+                "",
+                "Please ensure Docker and Docker Compose are installed and running."
+            ])
         
-        return CallToolResult(
-            content=[TextContent(
-                type="text",
-                text=output
-            )]
-        )
+        return _text_result(output)
         
     except Exception as e:
-        return CallToolResult(
-            content=[TextContent(
-                type="text",
-                text=f"Error checking Docker status: {str(e)}"
-            )]
-        )
+        return _text_result(f"Error checking Docker status: {str(e)}")
 
 # Helper functions
 
+def _text_result(text: str) -> CallToolResult:
+    """Wrap text in a tool result, skipping Pydantic validation."""
+    return CallToolResult.model_construct(
+        content=[TextContent.model_construct(type="text", text=text)]
+    )
+
 async def check_docker_availability() -> Dict[str, Any]:
-    """Check if Docker and Docker Compose are available."""
+    """Check that the docker CLI is on PATH without spawning it.
+
+    Compose V2 ships as a docker CLI plugin, so it is not probed here; a
+    missing plugin surfaces as a failed `docker compose` command instead.
+    """
+    if find_executable("docker") is None:
+        return {"available": False, "error": "docker CLI not on PATH"}
+    return {"available": True}
+
+async def get_docker_versions() -> Dict[str, Any]:
+    """Return the Docker and Docker Compose versions, cached briefly."""
+    global _docker_probe_cache
+    
+    async with _docker_probe_lock:
+        now = time.monotonic()
+        if _docker_probe_cache is not None and now - _docker_probe_cache[0] < DOCKER_PROBE_TTL:
+            return _docker_probe_cache[1]
+        
+        result = await probe_docker()
+        # Only cache success so a freshly started daemon is picked up at once
+        if result["available"]:
+            _docker_probe_cache = (now, result)
+        return result
+
+async def probe_docker() -> Dict[str, Any]:
+    """Query the Docker and Docker Compose versions concurrently."""
     try:
+        docker_result, compose_result = await asyncio.gather(
+            run_command(["docker", "--version"], cwd=None),
+            run_command(["docker", "compose", "version"], cwd=None)
+        )
+        
         # Check Docker
-        docker_result = await run_command(["docker", "--version"])
         if docker_result["returncode"] != 0:
             return {"available": False, "error": "Docker not found"}
         
         # Check Docker Compose
-        compose_result = await run_command(["docker", "compose", "version"])
         if compose_result["returncode"] != 0:
             return {"available": False, "error": "Docker Compose not found"}
         
-        return {"available": True}
+        return {
+            "available": True,
+            "docker": docker_result["stdout"].decode("utf-8", errors="replace").strip(),
+            "compose": compose_result["stdout"].decode("utf-8", errors="replace").strip()
+        }
         
     except Exception as e:
         return {"available": False, "error": str(e)}
 
-async def build_image(force: bool = False) -> Dict[str, Any]:
-    """Build the Docker image."""
+def get_timeout(arguments: Dict[str, Any]) -> float:
+    """Read the test run timeout argument, rejecting non-positive values."""
+    timeout = arguments.get("timeout", DEFAULT_TIMEOUT)
+    if isinstance(timeout, bool) or not isinstance(timeout, (int, float)) or timeout <= 0:
+        raise ValueError(f"timeout must be a positive number of seconds, got {timeout!r}")
+    return timeout
+
+def format_test_output(result: Dict[str, Any]) -> str:
+    """Format a test command result for display."""
+    success = result["returncode"] == 0
+    status = "✅ PASSED" if success else "❌ FAILED"
+    return "\n".join([
+        f"{status} - UCI Config Tool Tests",
+        "",
+        f"Return Code: {result['returncode']}",
+        "",
+        "=== TEST OUTPUT ===",
+        result["combined"],
+        "",
+        "=== SUMMARY ===",
+        f"Tests {'completed successfully' if success else 'failed'}"
+    ])
+
+def get_test_files() -> List[str]:
+    """Return the sorted test file names, cached until test/ changes."""
+    global _test_file_cache
+    
+    try:
+        mtime = TEST_DIR.stat().st_mtime_ns
+    except FileNotFoundError:
+        return []
+    
+    if _test_file_cache is not None and _test_file_cache[0] == mtime:
+        return _test_file_cache[1]
+    
+    # scandir yields bare names with cached file types: no Path objects,
+    # no fnmatch, and no extra stat per entry
+    with os.scandir(TEST_DIR) as entries:
+        test_files = sorted(
+            entry.name for entry in entries
+            if entry.name.startswith("test_")
+            and entry.name.endswith(".lua")
+            and entry.is_file(follow_symlinks=False)
+        )
+    _test_file_cache = (mtime, test_files)
+    return test_files
+
+def build_test_command(test_files: List[str]) -> List[str]:
+    """Build one `docker compose run` invocation running the given tests in order."""
+    script = " && ".join(
+        f"echo {shlex.quote(f'=== Running {test_file} ===')} && lua {shlex.quote(f'test/{test_file}')}"
+        for test_file in test_files
+    )
+    # -T skips pseudo-TTY allocation; --quiet-pull silences the implicit pull check
+    return [
+        "docker", "compose", "run", "--rm", "-T", "--quiet-pull",
+        TEST_SERVICE, "sh", "-c", script
+    ]
+
+async def image_exists(tag: str) -> bool:
+    """Check whether a Docker image is present locally."""
+    result = await run_command(
+        ["docker", "image", "inspect", "--format", "{{.Id}}", tag], cwd=None
+    )
+    return result["returncode"] == 0
+
+async def prewarm_cache(images: List[str]) -> None:
+    """Pull images concurrently; failures are left for the build to report."""
+    await asyncio.gather(*(run_command(["docker", "pull", image], cwd=None) for image in images))
+
+async def build_image(force: bool = False, verbose: bool = False) -> Dict[str, Any]:
+    """Build the Docker image, skipping the build if it already exists."""
     try:
+        if not force and await image_exists(TEST_IMAGE):
+            return {"success": True, "skipped": True, "output": "", "error": None}
+        
         cmd = ["docker", "compose", "build"]
         if force:
+            # Pull base images up front, in parallel, so the uncached build
+            # doesn't fetch them one at a time
+            await prewarm_cache(BASE_IMAGES)
             cmd.append("--no-cache")
         
-        result = await run_command(cmd)
+        result = await run_command(cmd, verbose=verbose)
         return {
             "success": result["returncode"] == 0,
-            "output": result["stdout"] + result["stderr"],
+            "skipped": False,
+            "output": result["combined"],
             "error": None if result["returncode"] == 0 else "Build failed"
         }
     except Exception as e:
-        return {"success": False, "output": "", "error": str(e)}
+        return {"success": False, "skipped": False, "output": "", "error": str(e)}
+
+@contextlib.asynccontextmanager
+async def _command_limiter(cmd: List[str]):
+    """Hold the semaphores bounding concurrent runs of cmd, if any.
+
+    Only the heavy compose commands are limited; version probes, image
+    inspects and pulls are short and must not queue behind test runs.
+    Builds take a build slot first, then one of the shared docker slots.
+    """
+    if cmd[:3] == ["docker", "compose", "build"]:
+        async with _docker_build_semaphore, _docker_semaphore:
+            yield
+    elif cmd[:3] == ["docker", "compose", "run"]:
+        async with _docker_semaphore:
+            yield
+    else:
+        yield
 
-async def run_command(cmd: List[str], verbose: bool = False) -> Dict[str, Any]:
-    """Run a command and return the result."""
+def _signal(process: asyncio.subprocess.Process, kill: bool = False) -> None:
+    """Terminate (or kill) a subprocess, ignoring one that has already exited."""
     try:
-        process = await asyncio.create_subprocess_exec(
-            *cmd,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE,
-            cwd=REPO_ROOT
-        )
-        
-        stdout, stderr = await process.communicate()
+        if kill:
+            process.kill()
+        else:
+            process.terminate()
+    except ProcessLookupError:
+        pass
+
+async def _stop(process: asyncio.subprocess.Process) -> None:
+    """Stop a subprocess, escalating to SIGKILL after STOP_GRACE_PERIOD.
+
+    SIGTERM first so the docker CLI forwards it and tears down the test
+    container; killing the CLI outright would leave the container running.
+    """
+    _signal(process)
+    try:
+        await asyncio.wait_for(process.wait(), STOP_GRACE_PERIOD)
+    except asyncio.TimeoutError:
+        _signal(process, kill=True)
+        # wait() also waits for pipe EOF, which a grandchild (such as the
+        # compose plugin) still holding the pipes can delay indefinitely;
+        # _reap() cancels the drains in that case
+        try:
+            await asyncio.wait_for(process.wait(), STOP_GRACE_PERIOD)
+        except asyncio.TimeoutError:
+            pass
+
+async def _drain(
+    stream: asyncio.StreamReader,
+    sink: bytearray,
+    echo: bool,
+    on_overflow: Callable[[], None]
+) -> None:
+    """Copy a subprocess pipe into sink as data arrives.
+
+    Echoed output goes to stderr: stdout carries the MCP protocol stream.
+    Past MAX_OUTPUT_BYTES on_overflow is called and the rest discarded.
+    """
+    dropped = 0
+    while chunk := await stream.read(READ_CHUNK_SIZE):
+        room = MAX_OUTPUT_BYTES - len(sink)
+        if len(chunk) > room:
+            on_overflow()
+            dropped += len(chunk) - room
+            chunk = chunk[:room]
+        sink.extend(chunk)
+        if echo and chunk:
+            sys.stderr.buffer.write(chunk)
+            sys.stderr.buffer.flush()
+    
+    if dropped:
+        sink.extend(f"\n... [truncated {dropped} bytes]\n".encode())
+
+async def _reap(pending: "asyncio.Future[Any]") -> None:
+    """Wait for a stopped command's drains to reach EOF, then collect them.
+
+    A grandchild still holding the pipes open could block EOF forever, so
+    drains still running after STOP_GRACE_PERIOD are cancelled.
+    """
+    if not pending.done():
+        await asyncio.wait({pending}, timeout=STOP_GRACE_PERIOD)
+    if not pending.done():
+        pending.cancel()
+    # Retrieve the outcome so a failed drain isn't reported as unhandled
+    await asyncio.gather(pending, return_exceptions=True)
+
+def find_executable(name: str) -> Optional[str]:
+    """Look a command up on PATH, remembering it once found."""
+    path = _executable_cache.get(name)
+    if path is None:
+        path = shutil.which(name)
+        if path is not None:
+            _executable_cache[name] = path
+    return path
+
+def resolve_executable(name: str) -> str:
+    """Resolve a command name to an absolute path where possible."""
+    return find_executable(name) or name
+
+async def run_command(
+    cmd: List[str],
+    verbose: bool = False,
+    cwd: Optional[Path] = REPO_ROOT,
+    timeout: Optional[float] = None
+) -> Dict[str, Any]:
+    """Run a command and return the result.
+    
+    Commands that don't depend on the working directory should pass
+    cwd=None: together with an absolute executable path and
+    close_fds=False (our own fds are non-inheritable anyway) that lets
+    CPython start the child with posix_spawn instead of fork/exec.
+    
+    stdout and stderr are returned as raw bytes for callers that need one
+    stream; "combined" is both, decoded once, for display.
+    
+    No time limit applies unless timeout is given; test runs pass one,
+    builds and pulls run to completion.
+    """
+    try:
+        async with _command_limiter(cmd):
+            process = await asyncio.create_subprocess_exec(
+                resolve_executable(cmd[0]), *cmd[1:],
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+                cwd=cwd,
+                close_fds=False
+            )
         
-        return {
-            "returncode": process.returncode,
-            "stdout": stdout.decode("utf-8"),
-            "stderr": stderr.decode("utf-8")
-        }
+            # Past the output cap: SIGTERM now, SIGKILL after the grace
+            # period even if the command has gone quiet
+            kill_timer: Optional[asyncio.TimerHandle] = None
+            
+            def stop_on_overflow() -> None:
+                nonlocal kill_timer
+                if kill_timer is None:
+                    _signal(process)
+                    kill_timer = asyncio.get_running_loop().call_later(
+                        STOP_GRACE_PERIOD, _signal, process, True
+                    )
+            
+            stdout, stderr = bytearray(), bytearray()
+            pending = asyncio.gather(
+                _drain(process.stdout, stdout, verbose, stop_on_overflow),
+                _drain(process.stderr, stderr, verbose, stop_on_overflow),
+                process.wait()
+            )
+            try:
+                done, _ = await asyncio.wait({pending}, timeout=timeout)
+            finally:
+                # Never leave the child or its drains behind, whether we
+                # timed out, failed, or the MCP request was cancelled
+                if process.returncode is None:
+                    await asyncio.shield(_stop(process))
+                await _reap(pending)
+                if kill_timer is not None:
+                    kill_timer.cancel()
+            
+            if done:
+                pending.result()
+                returncode = process.returncode
+            else:
+                stderr.extend(f"\nCommand timed out after {timeout} seconds\n".encode())
+                returncode = -1
+        
+            # Keep stderr from running into an unterminated last stdout line
+            separator = b"\n" if stdout and stderr and not stdout.endswith(b"\n") else b""
+            return {
+                "returncode": returncode,
+                "stdout": stdout,
+                "stderr": stderr,
+                "combined": separator.join((stdout, stderr)).decode("utf-8", errors="replace")
+            }
     except Exception as e:
         return {
             "returncode": -1,
-            "stdout": "",
-            "stderr": f"Command execution failed: {str(e)}"
+            "stdout": b"",
+            "stderr": f"Command execution failed: {str(e)}".encode(),
+            "combined": f"Command execution failed: {str(e)}"
         }
 
 async def main():
@@ -436,4 +719,7 @@ async def main():
         )
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    if uvloop is not None:
+        uvloop.run(main())
+    else:
+        asyncio.run(main())
\ No newline at end of file
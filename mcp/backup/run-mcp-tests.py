@@ -5,113 +5,152 @@ Simple client to run UCI config tool tests through MCP server
 """
 
 import asyncio
-import json
+import contextvars
 import sys
 from pathlib import Path
+from typing import TYPE_CHECKING, List
 
-from mcp.client.session import ClientSession
-from mcp.client.stdio import stdio_client, StdioServerParameters
+if TYPE_CHECKING:
+    from mcp.client.session import ClientSession
 
-async def run_tests():
+# uvloop is optional; it speeds up the stdio pipes to the server
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
+# Path to the MCP server script
+SERVER_SCRIPT = Path(__file__).parent.resolve() / "mcp-test-server.py"
+
+# Session shared by all helpers for the lifetime of one CLI invocation
+_session: contextvars.ContextVar["ClientSession"] = contextvars.ContextVar("mcp_session")
+
+async def _with_session(fn):
+    """Run fn(session) against a single long-lived MCP server session.
+
+    Reuses the session cached on the current context if there is one, so
+    nested helpers never respawn the server or repeat the handshake.
+    """
+    session = _session.get(None)
+    if session is not None:
+        return await fn(session)
+    
+    # Deferred so `help` and usage errors don't pay for the MCP imports
+    from mcp.client.session import ClientSession
+    from mcp.client.stdio import stdio_client, StdioServerParameters
+    
+    # Start the MCP server
+    server_params = StdioServerParameters(
+        command="python3",
+        args=[str(SERVER_SCRIPT)]
+    )
+    async with stdio_client(server_params) as (read, write):
+        async with ClientSession(read, write) as session:
+            
+            # Initialize the session
+            await session.initialize()
+            
+            token = _session.set(session)
+            try:
+                return await fn(session)
+            finally:
+                _session.reset(token)
+
+async def run_tests() -> bool:
     """Run tests through MCP server."""
     
-    # Path to the MCP server script
-    server_script = Path(__file__).parent / "mcp-test-server.py"
+    async def _run(session: "ClientSession"):
+        print("🚀 MCP Test Server Connected")
+        print("=" * 50)
+        
+        # Check Docker status and list tests concurrently; they're independent
+        docker_result, list_result = await asyncio.gather(
+            session.call_tool("check_docker_status", {}),
+            session.call_tool("list_test_files", {})
+        )
+        
+        print("📋 Checking Docker environment...")
+        print(docker_result.content[0].text)
+        print()
+        
+        print("📂 Available test files...")
+        print(list_result.content[0].text)
+        print()
+        
+        # Run all tests
+        print("🧪 Running all tests...")
+        print("=" * 50)
+        test_result = await session.call_tool("run_tests", {
+            "verbose": True,
+            "rebuild": False
+        })
+        print(test_result.content[0].text)
     
     try:
-        # Start the MCP server
-        server_params = StdioServerParameters(
-            command="python3",
-            args=[str(server_script)]
-        )
-        async with stdio_client(server_params) as (read, write):
-            async with ClientSession(read, write) as session:
-                
-                # Initialize the session
-                await session.initialize()
-                
-                print("🚀 MCP Test Server Connected")
-                print("=" * 50)
-                
-                # Check Docker status first
-                print("📋 Checking Docker environment...")
-                docker_result = await session.call_tool("check_docker_status", {})
-                print(docker_result.content[0].text)
-                print()
-                
-                # List available tests
-                print("📂 Available test files...")
-                list_result = await session.call_tool("list_test_files", {})
-                print(list_result.content[0].text)
-                print()
-                
-                # Run all tests
-                print("🧪 Running all tests...")
-                print("=" * 50)
-                test_result = await session.call_tool("run_tests", {
-                    "verbose": True,
-                    "rebuild": False
-                })
-                print(test_result.content[0].text)
-                
+        await _with_session(_run)
+        return True
     except Exception as e:
         print(f"❌ Error running MCP tests: {e}")
-        sys.exit(1)
+        return False
 
-async def run_single_test(test_file: str):
+async def run_single_test(test_file: str) -> bool:
     """Run a single test through MCP server."""
     
-    server_script = Path(__file__).parent / "mcp-test-server.py"
+    async def _run(session: "ClientSession"):
+        print(f"🚀 Running single test: {test_file}")
+        print("=" * 50)
+        
+        test_result = await session.call_tool("run_single_test", {
+            "test_file": test_file,
+            "verbose": True
+        })
+        print(test_result.content[0].text)
     
     try:
-        server_params = StdioServerParameters(
-            command="python3",
-            args=[str(server_script)]
-        )
-        async with stdio_client(server_params) as (read, write):
-            async with ClientSession(read, write) as session:
-                
-                await session.initialize()
-                
-                print(f"🚀 Running single test: {test_file}")
-                print("=" * 50)
-                
-                test_result = await session.call_tool("run_single_test", {
-                    "test_file": test_file,
-                    "verbose": True
-                })
-                print(test_result.content[0].text)
-                
+        await _with_session(_run)
+        return True
     except Exception as e:
         print(f"❌ Error running single test: {e}")
-        sys.exit(1)
+        return False
 
-async def build_image():
+async def run_test_batch(test_files: List[str]) -> bool:
+    """Run several tests in one container through MCP server."""
+    
+    async def _run(session: "ClientSession"):
+        print(f"🚀 Running {len(test_files)} tests: {', '.join(test_files)}")
+        print("=" * 50)
+        
+        test_result = await session.call_tool("run_tests", {
+            "specific_tests": test_files,
+            "verbose": True
+        })
+        print(test_result.content[0].text)
+    
+    try:
+        await _with_session(_run)
+        return True
+    except Exception as e:
+        print(f"❌ Error running tests: {e}")
+        return False
+
+async def build_image(force: bool = False) -> bool:
     """Build Docker image through MCP server."""
     
-    server_script = Path(__file__).parent / "mcp-test-server.py"
+    async def _run(session: "ClientSession"):
+        print("🔨 Building Docker test image...")
+        print("=" * 50)
+        
+        build_result = await session.call_tool("build_test_image", {
+            "force": force
+        })
+        print(build_result.content[0].text)
     
     try:
-        server_params = StdioServerParameters(
-            command="python3",
-            args=[str(server_script)]
-        )
-        async with stdio_client(server_params) as (read, write):
-            async with ClientSession(read, write) as session:
-                
-                await session.initialize()
-                
-                print("🔨 Building Docker test image...")
-                print("=" * 50)
-                
-                build_result = await session.call_tool("build_test_image", {
-                    "force": "--force" in sys.argv
-                })
-                print(build_result.content[0].text)
-                
+        await _with_session(_run)
+        return True
     except Exception as e:
         print(f"❌ Error building image: {e}")
-        sys.exit(1)
+        return False
 
 def show_help():
     """Show usage help."""
@@ -124,6 +163,7 @@ Usage:
 Commands:
   test                    Run all tests (default)
   test <file.lua>        Run specific test file
+  test <a.lua> <b.lua>   Run several test files in one container
   build                  Build Docker test image
   build --force          Force rebuild Docker image
   help                   Show this help
@@ -131,6 +171,7 @@ Commands:
 Examples:
   python3 run-mcp-tests.py                           # Run all tests
   python3 run-mcp-tests.py test test_uci_config.lua  # Run specific test
+  python3 run-mcp-tests.py test test_logger.lua test_fs_utils.lua
   python3 run-mcp-tests.py build                     # Build image
   python3 run-mcp-tests.py build --force             # Force rebuild
 
@@ -147,20 +188,39 @@ async def main():
     args = sys.argv[1:]
     
     if not args or args[0] == "test":
-        if len(args) > 1:
+        if len(args) > 2:
+            # Run several tests in one container
+            command = lambda: run_test_batch(args[1:])
+        elif len(args) > 1:
             # Run specific test
-            await run_single_test(args[1])
+            command = lambda: run_single_test(args[1])
         else:
             # Run all tests
-            await run_tests()
+            command = run_tests
     elif args[0] == "build":
-        await build_image()
+        command = lambda: build_image(force="--force" in args)
     elif args[0] == "help" or args[0] == "--help" or args[0] == "-h":
         show_help()
+        return
     else:
         print(f"❌ Unknown command: {args[0]}")
         print("Run 'python3 run-mcp-tests.py help' for usage information")
         sys.exit(1)
+    
+    # Spawn the server once; every tool call below shares this session.
+    # Helpers report failure instead of exiting so the session's task
+    # groups unwind before we do.
+    try:
+        success = await _with_session(lambda session: command())
+    except Exception as e:
+        print(f"❌ Error connecting to MCP server: {e}")
+        success = False
+    
+    if not success:
+        sys.exit(1)
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    if uvloop is not None:
+        uvloop.run(main())
+    else:
+        asyncio.run(main())
\ No newline at end of file
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Regression tests for mcp-test-server.py subprocess handling
+Run with: python3 -m unittest test_mcp_test_server.py
+"""
+
+import asyncio
+import importlib.util
+import time
+import unittest
+from pathlib import Path
+
+SERVER_SCRIPT = Path(__file__).parent / "mcp-test-server.py"
+
+try:
+    spec = importlib.util.spec_from_file_location("mcp_test_server", SERVER_SCRIPT)
+    server = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(server)
+except ImportError:
+    server = None
+
+@unittest.skipIf(server is None, "mcp package not installed")
+class RunCommandStopTests(unittest.TestCase):
+    """run_command() must return promptly once it decides to stop a command."""
+
+    def setUp(self):
+        self.saved = (server.STOP_GRACE_PERIOD, server.MAX_OUTPUT_BYTES)
+        server.STOP_GRACE_PERIOD = 1
+
+    def tearDown(self):
+        server.STOP_GRACE_PERIOD, server.MAX_OUTPUT_BYTES = self.saved
+
+    def run_timed(self, cmd, **kwargs):
+        start = time.monotonic()
+        result = asyncio.run(server.run_command(cmd, **kwargs))
+        return result, time.monotonic() - start
+
+    def test_timeout_with_grandchild_holding_pipes(self):
+        # sh ignores SIGTERM and its sleep child keeps the pipes open after
+        # sh is killed; the call must not wait for the sleep to finish
+        result, elapsed = self.run_timed(
+            ["sh", "-c", "trap '' TERM; echo hi; sleep 8"], timeout=1
+        )
+        self.assertEqual(result["returncode"], -1)
+        self.assertIn("hi", result["combined"])
+        self.assertIn("timed out", result["combined"])
+        self.assertLess(elapsed, 6)
+
+    def test_output_cap_kills_quiet_process_ignoring_sigterm(self):
+        # Past the cap the command goes quiet instead of exiting on SIGTERM;
+        # with no timeout it must still be killed after the grace period
+        server.MAX_OUTPUT_BYTES = 1000
+        result, elapsed = self.run_timed(
+            ["sh", "-c", "trap '' TERM; yes | head -c 100000; exec sleep 8"]
+        )
+        self.assertEqual(result["returncode"], -9)
+        self.assertIn("truncated", result["combined"])
+        self.assertLess(elapsed, 5)
+
+if __name__ == "__main__":
+    unittest.main()